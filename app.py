@@ -1,25 +1,39 @@
 import os
-import json
+import orjson
+import fastjsonschema
 import base64
 import time
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request
 from flask_cors import CORS
 from dotenv import load_dotenv
 from PIL import Image
 import io
-import requests
+import httpx
 
 # --- Load Environment Variables ---
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+if not GEMINI_API_KEY:
+    raise RuntimeError("GEMINI_API_KEY missing: set it in the environment or .env")
+
+# Uploads larger than this are rejected before being read
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
 
 app = Flask(__name__)
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
 CORS(app)
 
 # --- Gemini API Configuration ---
 MODEL_NAME = "gemini-2.5-flash-preview-05-20"
 GEMINI_API_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/models/"
 GEMINI_API_URL = f"{GEMINI_API_BASE_URL}{MODEL_NAME}:generateContent"
+# Partial response: Gemini only returns the generated text, not usage/safety metadata
+GEMINI_RESPONSE_FIELDS = "candidates.content.parts.text"
+_FULL_URL = f"{GEMINI_API_URL}?key={GEMINI_API_KEY}&fields={GEMINI_RESPONSE_FIELDS}"
+_HEADERS = {"Content-Type": "application/json"}
+
+# Longest edge (px) of the image sent to Gemini; enough to read a banknote
+MAX_IMAGE_SIDE = 1024
 
 SYSTEM_PROMPT = """
 You are a highly accurate currency note identifier. You are given an image of an Indian banknote (₹10, ₹20, ₹50, ₹100, ₹200, ₹500). The note can be front or back.
@@ -39,76 +53,125 @@ Output ONLY a strictly valid JSON object:
 If detection fails, set 'denomination' to "null".
 """
 
+# Expected shape of Gemini's reply; missing optional fields get their defaults.
+# A null side/denomination is how the model reports that no note was found.
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "side": {"type": ["string", "null"]},
+        "denomination": {"type": ["integer", "string", "null"], "default": "null"},
+        "full_validation": {"type": ["boolean", "string"], "enum": [True, False, "true", "false"], "default": False},
+        "speech_text": {"type": "string"}
+    },
+    "required": ["speech_text"]
+}
+_VALIDATE = fastjsonschema.compile(RESPONSE_SCHEMA)
+
+# Static request parts, built once; only the image part changes per call
+_SYSTEM_INSTRUCTION = {"parts": [{"text": SYSTEM_PROMPT}]}
+_TEXT_PART = {"text": "Analyze this Indian banknote image and return JSON exactly as requested."}
+
+# --- Shared HTTP/2 Client (multiplexes Gemini calls over kept-alive connections) ---
+CLIENT = httpx.Client(
+    http2=True,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+    timeout=httpx.Timeout(60.0, connect=5.0),
+)
+
 # --- Utility for API Retry ---
 def call_api_with_retry(url, headers, json_payload, max_retries=5):
+    # Serialize once so retries resend the same body instead of re-encoding the image
+    body = orjson.dumps(json_payload)
     for attempt in range(max_retries):
         try:
-            response = requests.post(url, headers=headers, json=json_payload)
+            response = CLIENT.post(url, headers=headers, content=body)
             response.raise_for_status()
             return response
-        except requests.exceptions.HTTPError as e:
+        except httpx.HTTPStatusError as e:
             if e.response.status_code in [429, 500, 502, 503, 504] and attempt < max_retries - 1:
                 time.sleep(2 ** attempt)
             else:
                 raise
-    raise requests.exceptions.RequestException("Max retries exceeded.")
+    raise httpx.HTTPError("Max retries exceeded.")
+
+# --- JSON Responses ---
+def ojsonify(d, status=200):
+    return app.response_class(orjson.dumps(d), status=status, mimetype="application/json")
+
+# --- Detection Pipeline ---
+def encode_image(raw):
+    # Small JPEG uploads are sent as-is
+    img = Image.open(io.BytesIO(raw))
+    if img.format == "JPEG" and max(img.size) <= MAX_IMAGE_SIDE:
+        return base64.b64encode(raw).decode("ascii")
+
+    # Pillow resizes "P" and "1" images with NEAREST whatever filter is asked for
+    if img.mode in ("P", "1"):
+        img = img.convert("RGB")
+    # Other images downscale before RGB conversion so JPEG decode can use draft mode
+    img.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE), Image.Resampling.BILINEAR)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=80, optimize=False)
+    return base64.b64encode(buffer.getbuffer()).decode("ascii")
+
+def run_detection(img_str):
+    payload = {
+        "contents": [
+            {
+                "role": "user",
+                "parts": [
+                    _TEXT_PART,
+                    {"inlineData": {"mimeType": "image/jpeg", "data": img_str}}
+                ]
+            }
+        ],
+        "systemInstruction": _SYSTEM_INSTRUCTION
+    }
+
+    response = call_api_with_retry(_FULL_URL, _HEADERS, payload)
+
+    raw_text = orjson.loads(response.content)['candidates'][0]['content']['parts'][0]['text'].strip()
+    json_text = raw_text.replace('```json','').replace('```','').strip()
+    result_json = _VALIDATE(orjson.loads(json_text))
+    if result_json['denomination'] is None:
+        result_json['denomination'] = "null"
+    result_json['denomination'] = str(result_json['denomination'])
+    if isinstance(result_json['full_validation'], str):
+        result_json['full_validation'] = result_json['full_validation'] == "true"
+
+    return result_json
 
 # --- Routes ---
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.errorhandler(413)
+def upload_too_large(e):
+    return ojsonify({"error": "Image too large.", "speech_text": "Image too large."}, 413)
+
 @app.route('/detect', methods=['POST'])
 def detect_currency():
-    if not GEMINI_API_KEY:
-        return jsonify({"error": "Gemini API Key not configured.", "speech_text": "API key missing."}), 500
     if 'image' not in request.files:
-        return jsonify({"error": "No image provided.", "speech_text": "No image received."}), 400
+        return ojsonify({"error": "No image provided.", "speech_text": "No image received."}, 400)
 
     image_file = request.files['image']
 
     try:
-        # Convert image to base64
-        img = Image.open(io.BytesIO(image_file.read()))
-        buffer = io.BytesIO()
-        img.save(buffer, format="JPEG")
-        img_str = base64.b64encode(buffer.getvalue()).decode()
-
-        payload = {
-            "contents": [
-                {
-                    "role": "user",
-                    "parts": [
-                        {"text": "Analyze this Indian banknote image and return JSON exactly as requested."},
-                        {"inlineData": {"mimeType": "image/jpeg", "data": img_str}}
-                    ]
-                }
-            ],
-            "systemInstruction": {"parts": [{"text": SYSTEM_PROMPT}]}
-        }
-
-        headers = {"Content-Type": "application/json"}
-        full_api_url = f"{GEMINI_API_URL}?key={GEMINI_API_KEY}"
-
-        response = call_api_with_retry(full_api_url, headers, payload)
-
-        raw_text = response.json()['candidates'][0]['content']['parts'][0]['text'].strip()
-        json_text = raw_text.replace('```json','').replace('```','').strip()
-        result_json = json.loads(json_text)
-
-        # Ensure full_validation is boolean
-        result_json['full_validation'] = bool(result_json.get('full_validation', False))
-        result_json['denomination'] = str(result_json.get('denomination', "null"))
-
-        return jsonify(result_json), 200
-
-    except json.JSONDecodeError:
-        return jsonify({"error": "Invalid JSON returned by Gemini.", "speech_text": "Analysis failed."}), 500
+        result_json = run_detection(encode_image(image_file.read()))
+        return ojsonify(result_json)
+
+    except orjson.JSONDecodeError:
+        return ojsonify({"error": "Invalid JSON returned by Gemini.", "speech_text": "Analysis failed."}, 500)
+    except fastjsonschema.JsonSchemaException as e:
+        return ojsonify({"error": f"Unexpected JSON returned by Gemini: {e.message}", "speech_text": "Analysis failed."}, 500)
     except Exception as e:
-        return jsonify({"error": str(e), "speech_text": "Internal server error."}), 500
+        return ojsonify({"error": str(e), "speech_text": "Internal server error."}, 500)
 
 # --- Main ---
 if __name__ == '__main__':
     print("Starting Flask server for Gemini API...")
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    app.run(host='0.0.0.0', port=5000)
 
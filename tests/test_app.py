@@ -0,0 +1,119 @@
+import base64
+import io
+import os
+import sys
+
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx
+import orjson
+import pytest
+from PIL import Image
+
+import app as currency_app
+
+
+def mock_gemini(monkeypatch, statuses):
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(statuses[len(requests) - 1], json={"ok": True})
+
+    monkeypatch.setattr(currency_app, "CLIENT", httpx.Client(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(currency_app.time, "sleep", lambda seconds: None)
+    return requests
+
+
+def test_retry_succeeds_after_transient_errors(monkeypatch):
+    requests = mock_gemini(monkeypatch, [503, 503, 200])
+    payload = {"contents": [{"parts": [{"text": "hi"}]}]}
+
+    response = currency_app.call_api_with_retry(currency_app._FULL_URL, currency_app._HEADERS, payload)
+
+    assert response.status_code == 200
+    assert len(requests) == 3
+    for request in requests:
+        assert request.headers["Content-Type"] == "application/json"
+        assert request.content == orjson.dumps(payload)
+
+
+def test_retry_raises_immediately_on_client_error(monkeypatch):
+    requests = mock_gemini(monkeypatch, [400, 200])
+
+    with pytest.raises(httpx.HTTPStatusError):
+        currency_app.call_api_with_retry(currency_app._FULL_URL, currency_app._HEADERS, {})
+    assert len(requests) == 1
+
+
+def gemini_reply(monkeypatch, reply):
+    class FakeResponse:
+        content = orjson.dumps({"candidates": [{"content": {"parts": [{"text": orjson.dumps(reply).decode()}]}}]})
+
+    monkeypatch.setattr(currency_app, "call_api_with_retry", lambda url, headers, payload: FakeResponse())
+    return currency_app.run_detection("img")
+
+
+def test_null_side_and_denomination_are_accepted(monkeypatch):
+    result = gemini_reply(monkeypatch, {
+        "side": None,
+        "denomination": None,
+        "full_validation": False,
+        "speech_text": "Note not clear, please show the note fully.",
+    })
+
+    assert result["denomination"] == "null"
+    assert result["speech_text"] == "Note not clear, please show the note fully."
+
+
+def test_string_full_validation_is_converted(monkeypatch):
+    result = gemini_reply(monkeypatch, {
+        "side": "back",
+        "denomination": 500,
+        "full_validation": "true",
+        "speech_text": "It is a 500 Rupees note.",
+    })
+    assert result["full_validation"] is True
+    assert result["denomination"] == "500"
+
+    result = gemini_reply(monkeypatch, {"full_validation": "false", "speech_text": "Note not clear."})
+    assert result["full_validation"] is False
+    assert result["denomination"] == "null"
+
+
+def test_oversized_upload_is_rejected_with_json_413():
+    client = currency_app.app.test_client()
+    data = {"image": (io.BytesIO(b"\0" * (currency_app.MAX_UPLOAD_BYTES + 1)), "frame.jpg")}
+    response = client.post("/detect", data=data, content_type="multipart/form-data")
+
+    assert response.status_code == 413
+    assert response.get_json()["speech_text"] == "Image too large."
+
+
+def test_small_jpeg_is_sent_without_reencoding():
+    buffer = io.BytesIO()
+    Image.new("RGB", (640, 480), (160, 140, 200)).save(buffer, format="JPEG", quality=85)
+    raw = buffer.getvalue()
+
+    assert base64.b64decode(currency_app.encode_image(raw)) == raw
+
+
+def test_palette_image_is_converted_and_downscaled(monkeypatch):
+    resample_modes = []
+    thumbnail = Image.Image.thumbnail
+
+    def recording_thumbnail(self, size, *args, **kwargs):
+        resample_modes.append(self.mode)
+        return thumbnail(self, size, *args, **kwargs)
+
+    monkeypatch.setattr(Image.Image, "thumbnail", recording_thumbnail)
+    buffer = io.BytesIO()
+    Image.new("RGB", (2048, 1536), (160, 140, 200)).convert("P").save(buffer, format="PNG")
+
+    encoded = Image.open(io.BytesIO(base64.b64decode(currency_app.encode_image(buffer.getvalue()))))
+
+    assert resample_modes == ["RGB"]
+    assert encoded.format == "JPEG"
+    assert encoded.mode == "RGB"
+    assert max(encoded.size) == currency_app.MAX_IMAGE_SIDE